@@ -1,64 +1,26 @@
-import uuid
-from typing import Dict, Any, Optional
-from google.adk.agents import Agent
-from google.adk.runners import InMemoryRunner
-from google.adk.tools import FunctionTool
-from google.genai import types
-from google.adk.events import Event
-
-# --- Load .env if present ---
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import logging.handlers
 import os
-try:
-    from dotenv import load_dotenv
-    # Try loading from current directory first (chapter1/.env)
-    dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-    if os.path.exists(dotenv_path):
-        load_dotenv(dotenv_path)
-    else:
-        # Fallback to parent directory
-        dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-        if os.path.exists(dotenv_path):
-            load_dotenv(dotenv_path)
-except ImportError:
-    pass  # dotenv is optional
-
-# --- Configure Service Account and Vertex AI credentials ---
-# Service account authentication is configured via GOOGLE_APPLICATION_CREDENTIALS
-# This environment variable should point to your service account JSON key file.
-#
-# Configuration options (in order of precedence):
-# 1. GOOGLE_APPLICATION_CREDENTIALS environment variable (already set)
-# 2. SERVICE_ACCOUNT_KEY_PATH from .env file
-# 3. Default path: cred/genai-vertex-data-engineering.json (relative to project root)
-#
-# To use a service account:
-# - Set SERVICE_ACCOUNT_KEY_PATH in your .env file, OR
-# - Set GOOGLE_APPLICATION_CREDENTIALS environment variable directly
-
-# Get service account key path from environment or use default
-service_account_path = (
-    os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or
-    os.environ.get('SERVICE_ACCOUNT_KEY_PATH') or
-    os.path.join(os.path.dirname(__file__), '..', '..', 'cred', 'genai-vertex-data-engineering.json')
-)
+import queue
+from typing import TYPE_CHECKING
 
-# Set GOOGLE_APPLICATION_CREDENTIALS if service account file exists
-if os.path.exists(service_account_path) and not os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.path.abspath(service_account_path)
-    print(f"Using service account: {os.environ['GOOGLE_APPLICATION_CREDENTIALS']}")
-elif not os.path.exists(service_account_path):
-    print(f"Warning: Service account file not found at {service_account_path}")
-    print("Set GOOGLE_APPLICATION_CREDENTIALS or SERVICE_ACCOUNT_KEY_PATH to use service account authentication.")
+from common.coordinator import Coordinator
+from common.env import load_environment
 
-# Get Vertex AI configuration from environment variables
-VERTEX_PROJECT = os.environ.get('GOOGLE_CLOUD_PROJECT') or os.environ.get('GCP_PROJECT') or os.environ.get('PROJECT')
-VERTEX_LOCATION = os.environ.get('GOOGLE_CLOUD_LOCATION') or os.environ.get('GCP_LOCATION') or os.environ.get('LOCATION', 'us-central1')
+logger = logging.getLogger(__name__)
 
-# Set environment variables as fallback for underlying Client initialization
-if VERTEX_PROJECT and not os.environ.get('GOOGLE_CLOUD_PROJECT'):
-    os.environ['GOOGLE_CLOUD_PROJECT'] = VERTEX_PROJECT
-if VERTEX_LOCATION and not os.environ.get('GOOGLE_CLOUD_LOCATION'):
-    os.environ['GOOGLE_CLOUD_LOCATION'] = VERTEX_LOCATION
+# google-adk is imported where it is first needed so that importing this
+# module (e.g. just for the handlers) stays cheap.
+if TYPE_CHECKING:
+    from google.adk.agents import Agent
+    from google.adk.runners import InMemoryRunner
+
+# Load .env and configure service account and Vertex AI credentials
+VERTEX_PROJECT, VERTEX_LOCATION = load_environment(os.path.dirname(__file__))
 
 
 # --- Define Tool Functions ---
@@ -73,7 +35,7 @@ def booking_handler(request: str) -> str:
     Returns:
         str: A confirmation message for the booking that the booking was handled.
     """
-    print("------- Booking Handler Called -------")
+    logger.info("Booking handler called: %s", request)
     return f"Booking action for '{request}' has been simulated."
 
 def info_handler(request: str) -> str:
@@ -85,7 +47,7 @@ def info_handler(request: str) -> str:
     Returns:
         A message indicating that the information request was handled.
     """
-    print("------- Info Handler Called -------")
+    logger.info("Info handler called: %s", request)
     return f"Information request for '{request}'. Result: Simulated information retrieval."
 
 def unclear_handler(request: str) -> str:
@@ -94,11 +56,6 @@ def unclear_handler(request: str) -> str:
     """
     return f"Coordinator could not delegate request: '{request}'. Please clarify."
 
-# --- Create Tools ---
-booking_tool = FunctionTool(booking_handler)
-info_tool = FunctionTool(info_handler)
-
-# --- Define specialized sub-agents equipped with their respective tools ---
 # Configure model - use string model name
 # Vertex AI configuration is handled via environment variables set above:
 # - GOOGLE_APPLICATION_CREDENTIALS (service account)
@@ -107,81 +64,132 @@ info_tool = FunctionTool(info_handler)
 # The Agent's underlying Client will detect these and use Vertex AI automatically
 model_name = "gemini-2.5-flash"
 
-booking_agent = Agent(
-    name="Booker",
-    model=model_name,
-    description="""A specialist agent that handles all flights 
+# Delegation instructions for the coordinator agent
+COORDINATOR_INSTRUCTION = (
+    "You are the main coordinator. Your only task is to analyze incoming user requests "
+    "and delegate them to the appropriate specialist agents. Do not try to answer the user directly. \n"
+    "- For any requests related to booking flights or hotels, delegate to the 'Booker' agent. \n "
+    "- For all other general information questions, delegate to the 'Info' agent. \n"
+)
+
+@functools.cache
+def get_root_agent() -> Agent:
+    """
+    Builds the agent graph on first use and returns the cached root agent.
+    Deferring construction keeps importing this module cheap for callers
+    that only need the handler functions.
+    """
+    from google.adk.agents import Agent
+    from google.adk.tools import FunctionTool
+
+    # --- Create Tools ---
+    booking_tool = FunctionTool(booking_handler)
+    info_tool = FunctionTool(info_handler)
+
+    # --- Define specialized sub-agents equipped with their respective tools ---
+    booking_agent = Agent(
+        name="Booker",
+        model=model_name,
+        description="""A specialist agent that handles all flights 
                 and hotel booking requests by calling the booking tool.""",
-    tools=[booking_tool]
-    )
+        tools=[booking_tool]
+        )
 
-info_agent = Agent(
-    name="Info",
-    model=model_name,
-    description="""A specialist agent that handles all general information 
+    info_agent = Agent(
+        name="Info",
+        model=model_name,
+        description="""A specialist agent that handles all general information 
                 and answers user questions by calling the info tool.""",
-    tools=[info_tool]
+        tools=[info_tool]
+        )
+
+    # --- Define the parent agent with explicit delegation instructions
+    return Agent(
+        name="Coordinator",
+        model=model_name,
+        instruction=COORDINATOR_INSTRUCTION,
+        description="A coordinator that routes user requests to the correct specialist agent.",
+        # The presence of sub_agents enables LLM-driven delegation (Auto-Flow) by default.
+        sub_agents=[booking_agent, info_agent]
     )
 
-# --- Define the parent agent with explicit delegation instructions
-root_agent = Agent(
-    name="Coordinator",
-    model=model_name,
-    instruction=(
-        "You are the main coordinator. Your only task is to analyze incoming user requests "
-        "and delegate them to the appropriate specialist agents. Do not try to answer the user directly. \n"
-        "- For any requests related to booking flights or hotels, delegate to the 'Booker' agent. \n "
-        "- For all other general information questions, delegate to the 'Info' agent. \n"
+
+@functools.cache
+def get_runner() -> InMemoryRunner:
+    """
+    Returns a shared runner for the root agent, built on first use.
+    The runner can be shared by the asyncio tasks of one event loop;
+    requests are kept apart by their session IDs. The first call is not
+    guarded against other threads, so make it before starting any.
+    """
+    from google.adk.runners import InMemoryRunner
+
+    return InMemoryRunner(get_root_agent())
+
+
+def __getattr__(name: str):
+    # Keep `from ... import root_agent` (and the ADK CLI loader) working
+    # while the agent graph itself is built lazily.
+    if name == "root_agent":
+        return get_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Expose root_agent at module level
+__all__ = ["root_agent", "get_root_agent", "get_runner"]
+
+# --- Keyword Fast Path ---
+# Requests whose specialist is obvious from a keyword are handed straight to
+# that specialist's handler, skipping the LLM round-trip. Anything ambiguous
+# (no match, or more than one) still goes through LLM delegation.
+# Info is the catch-all for everything else, so it has no pattern and
+# is always left to the LLM. A keyword alone (e.g. "book" or "flights") is not
+# enough for Booker: the request has to open with a booking verb (after an
+# optional polite lead-in) followed by something bookable, so questions about
+# booking ("Is it cheaper to book...") and negations ("Don't book...") are
+# left to the LLM.
+_INTENT_PATTERNS = {
+    "Booker": (
+        r"^(?:(?:please|kindly|can you|could you|would you|i want to|i'd like to|"
+        r"i would like to|i need to|help me)\s+)*"
+        r"(?:book|reserve)\b.{0,40}?\b(?:flights?|hotels?|rooms?|tickets?)\b"
     ),
-    description="A coordinator that routes user requests to the correct specialist agent.",
-    # The presence of sub_agents enables LLM-driven delegation (Auto-Flow) by default.
-    sub_agents=[booking_agent, info_agent]
+}
+_INTENT_HANDLERS = {
+    "Booker": booking_handler,
+    "Info": info_handler,
+}
+
+# Example requests per specialist for embedding routing
+_INTENT_EXAMPLES = {
+    "Booker": [
+        "Book me a hotel in Paris.",
+        "Find flights to Tokyo next month.",
+        "Reserve a room for two nights in London.",
+        "I need a plane ticket to New York on Friday.",
+    ],
+    "Info": [
+        "What is the highest mountain in the world?",
+        "Tell me a random fact.",
+        "Who wrote Pride and Prejudice?",
+        "How does photosynthesis work?",
+    ],
+}
+
+coordinator = Coordinator(
+    "chapter1",
+    label="Coordinator",
+    intent_patterns=_INTENT_PATTERNS,
+    intent_handlers=_INTENT_HANDLERS,
+    intent_examples=_INTENT_EXAMPLES,
+    # Cached results go stale when the model or the delegation rules change
+    cache_version=f"{model_name}\n{COORDINATOR_INSTRUCTION}",
 )
 
-# Expose root_agent at module level
-__all__ = ["root_agent"]
+# Runs the coordinator agent with a given request and delegates.
+run_coordinator = coordinator.run
 
-# --- Execute Logic --- 
-async def run_coordinator(runner: InMemoryRunner, request: str):
-    """
-    Runs the coordinator agent with a given request and delegates.
-    """
-    print(f"\n --- Running Coordinator for request: '{request}' --- ")
-    final_result = ""
-    
-    try:
-        user_id = "user_123"
-        session_id = str(uuid.uuid4())
-        await runner.session_service.create_session(
-            app_name=runner.app_name,
-            user_id=user_id,
-            session_id=session_id
-        )
-        
-        for event in runner.run(
-            user_id=user_id,
-            session_id=session_id,
-            new_message=types.Content(
-                role="user", 
-                parts=[types.Part(text=request)]
-                )
-        ):
-            if event.is_final_response() and event.content:
-                # Try to get text directly from event content
-                # to avoid iterating parts
-                if hasattr(event.content, 'text') and event.content.text:
-                    final_result = event.content.text
-                elif event.content.parts:
-                    # Fallback to iterating parts and extract text (might trigger warning)
-                    text_parts = [part.text for part in event.content.parts if part.text]
-                    final_result = " ".join(text_parts)
-                # Assume the loop should break after the final response
-                break
-            print(f"Coordinator Final Response: {final_result}")
-            return final_result
-    except Exception as e:
-        print(f"An error occurred while processing the your request: {e}")
-        return f"An error occurred while processing your request: {e}"
+# Runs many independent coordinator requests concurrently, in order.
+run_coordinator_batch = coordinator.run_batch
 
 async def main():
     """Main function to run the ADK example.
@@ -189,21 +197,33 @@ async def main():
     print("--- Google ADK Routing Example (ADK Auto-Flow Style) ---")
     print("Note: This requests Google ADK installed and authenticated.")
     
-    runner = InMemoryRunner(root_agent)
-    
-    # Example Usage
-    result_a = await run_coordinator(runner, "Book me a hotel in Paris.")
-    print(f"Final Output A: {result_a}\n")
-    
-    result_b = await run_coordinator(runner, "What is the highest mountain in the world?")
-    print(f"Final Output B: {result_b}\n")
-    
-    result_c = await run_coordinator(runner, "Tell me a random fact.")
-    print(f"Final Output C: {result_c}\n")
-    
-    result_d = await run_coordinator(runner, "Find flights to Tokyo next month.")
-    print(f"Final Output D: {result_d}\n")
+    # Log through a queue so handler I/O happens on a background thread and
+    # never blocks the event loop while requests run concurrently.
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    # Show this example's progress without the INFO chatter of google-adk,
+    # google-genai and httpx, which stay at the root logger's WARNING level
+    for name in (__name__, "common"):
+        logging.getLogger(name).setLevel(logging.INFO)
+    listener.start()
+
+    try:
+        runner = get_runner()
+
+        # Example Usage
+        prompts = [
+            "Book me a hotel in Paris.",
+            "What is the highest mountain in the world?",
+            "Tell me a random fact.",
+            "Find flights to Tokyo next month.",
+        ]
+        results = await run_coordinator_batch(runner, prompts)
+    finally:
+        # Flush pending log records before printing the results
+        listener.stop()
+    for i, result in enumerate(results):
+        print(f"Final Output {chr(ord('A') + i)}: {result}\n")
     
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
\ No newline at end of file
@@ -1,64 +1,26 @@
-import uuid
-from typing import Dict, Any, Optional
-from google.adk.agents import Agent
-from google.adk.runners import InMemoryRunner
-from google.adk.tools import FunctionTool
-from google.genai import types
-from google.adk.events import Event
-
-# --- Load .env if present ---
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import logging.handlers
 import os
-try:
-    from dotenv import load_dotenv
-    # Try loading from current directory first (chapter2/.env)
-    dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-    if os.path.exists(dotenv_path):
-        load_dotenv(dotenv_path)
-    else:
-        # Fallback to parent directory
-        dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-        if os.path.exists(dotenv_path):
-            load_dotenv(dotenv_path)
-except ImportError:
-    pass  # dotenv is optional
-
-# --- Configure Service Account and Vertex AI credentials ---
-# Service account authentication is configured via GOOGLE_APPLICATION_CREDENTIALS
-# This environment variable should point to your service account JSON key file.
-#
-# Configuration options (in order of precedence):
-# 1. GOOGLE_APPLICATION_CREDENTIALS environment variable (already set)
-# 2. SERVICE_ACCOUNT_KEY_PATH from .env file
-# 3. Default path: cred/genai-vertex-data-engineering.json (relative to project root)
-#
-# To use a service account:
-# - Set SERVICE_ACCOUNT_KEY_PATH in your .env file, OR
-# - Set GOOGLE_APPLICATION_CREDENTIALS environment variable directly
-
-# Get service account key path from environment or use default
-service_account_path = (
-    os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or
-    os.environ.get('SERVICE_ACCOUNT_KEY_PATH') or
-    os.path.join(os.path.dirname(__file__), '..', '..', 'cred', 'genai-vertex-data-engineering.json')
-)
+import queue
+from typing import TYPE_CHECKING
 
-# Set GOOGLE_APPLICATION_CREDENTIALS if service account file exists
-if os.path.exists(service_account_path) and not os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.path.abspath(service_account_path)
-    print(f"Using service account: {os.environ['GOOGLE_APPLICATION_CREDENTIALS']}")
-elif not os.path.exists(service_account_path):
-    print(f"Warning: Service account file not found at {service_account_path}")
-    print("Set GOOGLE_APPLICATION_CREDENTIALS or SERVICE_ACCOUNT_KEY_PATH to use service account authentication.")
+from common.coordinator import Coordinator
+from common.env import load_environment
 
-# Get Vertex AI configuration from environment variables
-VERTEX_PROJECT = os.environ.get('GOOGLE_CLOUD_PROJECT') or os.environ.get('GCP_PROJECT') or os.environ.get('PROJECT')
-VERTEX_LOCATION = os.environ.get('GOOGLE_CLOUD_LOCATION') or os.environ.get('GCP_LOCATION') or os.environ.get('LOCATION', 'us-central1')
+logger = logging.getLogger(__name__)
 
-# Set environment variables as fallback for underlying Client initialization
-if VERTEX_PROJECT and not os.environ.get('GOOGLE_CLOUD_PROJECT'):
-    os.environ['GOOGLE_CLOUD_PROJECT'] = VERTEX_PROJECT
-if VERTEX_LOCATION and not os.environ.get('GOOGLE_CLOUD_LOCATION'):
-    os.environ['GOOGLE_CLOUD_LOCATION'] = VERTEX_LOCATION
+# google-adk is imported where it is first needed so that importing this
+# module (e.g. just for the handlers) stays cheap.
+if TYPE_CHECKING:
+    from google.adk.agents import Agent
+    from google.adk.runners import InMemoryRunner
+
+# Load .env and configure service account and Vertex AI credentials
+VERTEX_PROJECT, VERTEX_LOCATION = load_environment(os.path.dirname(__file__))
 
 
 # --- Define Tool Functions ---
@@ -74,7 +36,7 @@ def technical_support_handler(issue: str) -> str:
     Returns:
         str: A response with troubleshooting steps or solution.
     """
-    print("------- Technical Support Handler Called -------")
+    logger.info("Technical Support handler called: %s", issue)
     return f"Technical support for '{issue}': Troubleshooting steps have been provided. Issue logged for tracking."
 
 def billing_handler(inquiry: str) -> str:
@@ -87,7 +49,7 @@ def billing_handler(inquiry: str) -> str:
     Returns:
         str: A response with billing information or resolution.
     """
-    print("------- Billing Handler Called -------")
+    logger.info("Billing handler called: %s", inquiry)
     return f"Billing inquiry for '{inquiry}': Account information retrieved. Payment status confirmed."
 
 def product_info_handler(question: str) -> str:
@@ -100,15 +62,9 @@ def product_info_handler(question: str) -> str:
     Returns:
         str: A response with product information.
     """
-    print("------- Product Info Handler Called -------")
+    logger.info("Product Info handler called: %s", question)
     return f"Product information for '{question}': Detailed product specifications and features provided."
 
-# --- Create Tools ---
-technical_support_tool = FunctionTool(technical_support_handler)
-billing_tool = FunctionTool(billing_handler)
-product_info_tool = FunctionTool(product_info_handler)
-
-# --- Define specialized sub-agents equipped with their respective tools ---
 # Configure model - use string model name
 # Vertex AI configuration is handled via environment variables set above:
 # - GOOGLE_APPLICATION_CREDENTIALS (service account)
@@ -117,90 +73,143 @@ product_info_tool = FunctionTool(product_info_handler)
 # The Agent's underlying Client will detect these and use Vertex AI automatically
 model_name = "gemini-2.5-flash"
 
-technical_agent = Agent(
-    name="TechnicalSupport",
-    model=model_name,
-    description="""A specialist agent that handles technical support requests, 
-                troubleshooting, and technical issues by calling the technical support tool.""",
-    tools=[technical_support_tool]
+# Delegation instructions for the coordinator agent
+COORDINATOR_INSTRUCTION = (
+    "You are a customer support coordinator. Your task is to analyze incoming customer requests "
+    "and delegate them to the appropriate specialist agents. Do not try to answer the customer directly. \n"
+    "- For technical issues, troubleshooting, or technical support requests, delegate to the 'TechnicalSupport' agent. \n"
+    "- For billing inquiries, payment questions, or account financial matters, delegate to the 'Billing' agent. \n"
+    "- For product information, feature questions, or product specifications, delegate to the 'ProductInfo' agent. \n"
 )
 
-billing_agent = Agent(
-    name="Billing",
-    model=model_name,
-    description="""A specialist agent that handles billing inquiries, payment questions, 
+@functools.cache
+def get_root_agent() -> Agent:
+    """
+    Builds the agent graph on first use and returns the cached root agent.
+    Deferring construction keeps importing this module cheap for callers
+    that only need the handler functions.
+    """
+    from google.adk.agents import Agent
+    from google.adk.tools import FunctionTool
+
+    # --- Create Tools ---
+    technical_support_tool = FunctionTool(technical_support_handler)
+    billing_tool = FunctionTool(billing_handler)
+    product_info_tool = FunctionTool(product_info_handler)
+
+    # --- Define specialized sub-agents equipped with their respective tools ---
+    technical_agent = Agent(
+        name="TechnicalSupport",
+        model=model_name,
+        description="""A specialist agent that handles technical support requests, 
+                troubleshooting, and technical issues by calling the technical support tool.""",
+        tools=[technical_support_tool]
+    )
+
+    billing_agent = Agent(
+        name="Billing",
+        model=model_name,
+        description="""A specialist agent that handles billing inquiries, payment questions, 
                 and account-related financial matters by calling the billing tool.""",
-    tools=[billing_tool]
-)
+        tools=[billing_tool]
+    )
 
-product_agent = Agent(
-    name="ProductInfo",
-    model=model_name,
-    description="""A specialist agent that handles product information requests, 
+    product_agent = Agent(
+        name="ProductInfo",
+        model=model_name,
+        description="""A specialist agent that handles product information requests, 
                 feature questions, and product specifications by calling the product info tool.""",
-    tools=[product_info_tool]
-)
+        tools=[product_info_tool]
+    )
+
+    # --- Define the parent agent with explicit delegation instructions
+    return Agent(
+        name="SupportCoordinator",
+        model=model_name,
+        instruction=COORDINATOR_INSTRUCTION,
+        description="A customer support coordinator that routes customer requests to the correct specialist agent.",
+        # The presence of sub_agents enables LLM-driven delegation (Auto-Flow) by default.
+        sub_agents=[technical_agent, billing_agent, product_agent]
+    )
+
+
+@functools.cache
+def get_runner() -> InMemoryRunner:
+    """
+    Returns a shared runner for the root agent, built on first use.
+    The runner can be shared by the asyncio tasks of one event loop;
+    requests are kept apart by their session IDs. The first call is not
+    guarded against other threads, so make it before starting any.
+    """
+    from google.adk.runners import InMemoryRunner
 
-# --- Define the parent agent with explicit delegation instructions
-root_agent = Agent(
-    name="SupportCoordinator",
-    model=model_name,
-    instruction=(
-        "You are a customer support coordinator. Your task is to analyze incoming customer requests "
-        "and delegate them to the appropriate specialist agents. Do not try to answer the customer directly. \n"
-        "- For technical issues, troubleshooting, or technical support requests, delegate to the 'TechnicalSupport' agent. \n"
-        "- For billing inquiries, payment questions, or account financial matters, delegate to the 'Billing' agent. \n"
-        "- For product information, feature questions, or product specifications, delegate to the 'ProductInfo' agent. \n"
-    ),
-    description="A customer support coordinator that routes customer requests to the correct specialist agent.",
-    # The presence of sub_agents enables LLM-driven delegation (Auto-Flow) by default.
-    sub_agents=[technical_agent, billing_agent, product_agent]
-)
+    return InMemoryRunner(get_root_agent())
+
+
+def __getattr__(name: str):
+    # Keep `from ... import root_agent` (and the ADK CLI loader) working
+    # while the agent graph itself is built lazily.
+    if name == "root_agent":
+        return get_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Expose root_agent at module level
-__all__ = ["root_agent"]
+__all__ = ["root_agent", "get_root_agent", "get_runner"]
+
+# --- Keyword Fast Path ---
+# Requests whose specialist is obvious from a keyword are handed straight to
+# that specialist's handler, skipping the LLM round-trip. Anything ambiguous
+# (no match, or more than one) still goes through LLM delegation.
+# Only unambiguous keywords are used: words like "plan" or "charge" also
+# appear in unrelated requests.
+_INTENT_PATTERNS = {
+    "TechnicalSupport": r"\b(?:log ?in(?:to)?|sign ?in|password|error (?:message|code)s?|crash(?:es|ed|ing)?|not working|troubleshoot(?:ing)?)\b",
+    "Billing": r"\b(?:bills?|billing|invoices?|payments?|refunds?)\b",
+    "ProductInfo": r"\b(?:features?|specs|specifications?)\b",
+}
+_INTENT_HANDLERS = {
+    "TechnicalSupport": technical_support_handler,
+    "Billing": billing_handler,
+    "ProductInfo": product_info_handler,
+}
+
+# Example requests per specialist for embedding routing
+_INTENT_EXAMPLES = {
+    "TechnicalSupport": [
+        "I can't log into my account. Can you help?",
+        "The app keeps crashing when I open it.",
+        "I forgot my password and the reset email never arrives.",
+        "The website shows an error when I upload a file.",
+    ],
+    "Billing": [
+        "What are the payment options available?",
+        "My payment failed. What should I do?",
+        "I was charged twice this month.",
+        "How do I get a refund?",
+    ],
+    "ProductInfo": [
+        "What features does the premium plan include?",
+        "Does the product support offline mode?",
+        "What are the differences between the basic and pro versions?",
+        "Which platforms is the app available on?",
+    ],
+}
+
+coordinator = Coordinator(
+    "chapter2",
+    label="Support Coordinator",
+    intent_patterns=_INTENT_PATTERNS,
+    intent_handlers=_INTENT_HANDLERS,
+    intent_examples=_INTENT_EXAMPLES,
+    # Cached results go stale when the model or the delegation rules change
+    cache_version=f"{model_name}\n{COORDINATOR_INSTRUCTION}",
+)
 
-# --- Execute Logic --- 
-async def run_support_coordinator(runner: InMemoryRunner, request: str):
-    """
-    Runs the support coordinator agent with a given request and delegates.
-    """
-    print(f"\n --- Running Support Coordinator for request: '{request}' --- ")
-    final_result = ""
-    
-    try:
-        user_id = "user_123"
-        session_id = str(uuid.uuid4())
-        await runner.session_service.create_session(
-            app_name=runner.app_name,
-            user_id=user_id,
-            session_id=session_id
-        )
-        
-        for event in runner.run(
-            user_id=user_id,
-            session_id=session_id,
-            new_message=types.Content(
-                role="user", 
-                parts=[types.Part(text=request)]
-                )
-        ):
-            if event.is_final_response() and event.content:
-                # Try to get text directly from event content
-                # to avoid iterating parts
-                if hasattr(event.content, 'text') and event.content.text:
-                    final_result = event.content.text
-                elif event.content.parts:
-                    # Fallback to iterating parts and extract text (might trigger warning)
-                    text_parts = [part.text for part in event.content.parts if part.text]
-                    final_result = " ".join(text_parts)
-                # Assume the loop should break after the final response
-                break
-            print(f"Support Coordinator Final Response: {final_result}")
-            return final_result
-    except Exception as e:
-        print(f"An error occurred while processing the request: {e}")
-        return f"An error occurred while processing your request: {e}"
+# Runs the support coordinator agent with a given request and delegates.
+run_support_coordinator = coordinator.run
+
+# Runs many independent support coordinator requests concurrently, in order.
+run_support_coordinator_batch = coordinator.run_batch
 
 async def main():
     """Main function to run the ADK example.
@@ -208,22 +217,39 @@ async def main():
     print("--- Google ADK Customer Support Example (ADK Auto-Flow Style) ---")
     print("Note: This requires Google ADK installed and authenticated.")
     
-    runner = InMemoryRunner(root_agent)
-    
-    # Example Usage
-    result_a = await run_support_coordinator(runner, "I can't log into my account. Can you help?")
-    print(f"Final Output A: {result_a}\n")
-    
-    result_b = await run_support_coordinator(runner, "What are the payment options available?")
-    print(f"Final Output B: {result_b}\n")
-    
-    result_c = await run_support_coordinator(runner, "What features does the premium plan include?")
-    print(f"Final Output C: {result_c}\n")
-    
-    result_d = await run_support_coordinator(runner, "My payment failed. What should I do?")
-    print(f"Final Output D: {result_d}\n")
+    # Log through a queue so handler I/O happens on a background thread and
+    # never blocks the event loop while requests run concurrently.
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    # Show this example's progress without the INFO chatter of google-adk,
+    # google-genai and httpx, which stay at the root logger's WARNING level
+    for name in (__name__, "common"):
+        logging.getLogger(name).setLevel(logging.INFO)
+    listener.start()
+
+    try:
+        runner = get_runner()
+
+        # Example Usage
+        # These match a keyword pattern and go straight to the specialist's handler
+        fast_path_prompts = [
+            "I can't log into my account. Can you help?",
+            "What are the payment options available?",
+        ]
+        # These run through the agents to show LLM-driven delegation
+        agent_prompts = [
+            "What features does the premium plan include?",
+            "My payment failed. What should I do?",
+        ]
+        results = await run_support_coordinator_batch(runner, fast_path_prompts)
+        results += await run_support_coordinator_batch(runner, agent_prompts, fast_path=False)
+    finally:
+        # Flush pending log records before printing the results
+        listener.stop()
+    for i, result in enumerate(results):
+        print(f"Final Output {chr(ord('A') + i)}: {result}\n")
     
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
 
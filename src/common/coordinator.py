@@ -0,0 +1,463 @@
+"""
+Request routing shared by the chapter coordinators.
+
+A Coordinator answers a request from the route cache, from a specialist
+picked by keyword or embedding match, or by running the ADK agent graph
+(LLM-driven delegation), in that order.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set
+
+from .env import env_int
+
+# google-adk / google-genai are imported where they are first needed so that
+# importing the chapter agents (e.g. just for the handlers) stays cheap.
+if TYPE_CHECKING:
+    from google.adk.runners import InMemoryRunner
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# User ID that example requests are issued under
+USER_ID = "user_123"
+
+# Maximum number of coordinator requests run concurrently in a batch.
+# Override with ADK_MAX_PARALLEL to match your model quota; values below 1
+# are raised to 1 so a batch can always make progress.
+MAX_PARALLEL = env_int('ADK_MAX_PARALLEL', 4)
+
+# Whether requests may be answered by keyword or embedding routing without
+# running the agents. Set ADK_FAST_PATH=0 to always use LLM delegation.
+FAST_PATH = os.environ.get('ADK_FAST_PATH', '1') != '0'
+
+# --- Routing Cache ---
+# Identical (or trivially different) requests always route to the same specialist
+# and produce the same final response, so we cache the final result keyed by a
+# normalized form of the request and skip the LLM round-trip on a hit.
+# The cache is kept in SQLite so later runs of the example reuse it too.
+# It lives in the user's own cache directory, never a shared one such as
+# /tmp where another user could plant answers. Override the location with
+# ADK_CACHE_DIR.
+ROUTE_CACHE_DIR = os.environ.get('ADK_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'adk_route_cache',
+)
+# Seconds a cached result stays valid
+ROUTE_CACHE_TTL = 3600
+
+# --- Embedding Routing ---
+# Paraphrases the keyword patterns miss are routed by comparing the request's
+# embedding with the mean embedding (centroid) of a few example requests per
+# specialist. One embedding call is much cheaper than an LLM delegation; the
+# LLM is still used when no specialist is clearly the most similar.
+# It is off by default: every request that still ends up at the LLM pays an
+# extra embedding round trip, and the thresholds below should be checked
+# against your own traffic (see tests/test_routing.py) before relying on them.
+# Set ADK_EMBEDDING_ROUTING=1 to enable it.
+EMBEDDING_ROUTING = os.environ.get('ADK_EMBEDDING_ROUTING', '0') == '1'
+EMBEDDING_MODEL = "text-embedding-004"
+# Minimum cosine similarity to a centroid for routing without the LLM
+EMBEDDING_ROUTE_THRESHOLD = 0.75
+# Minimum lead of the best centroid's similarity over the runner-up, so that
+# requests sitting between two specialists are left to the LLM
+EMBEDDING_ROUTE_MARGIN = 0.05
+# Seconds to skip embedding routing after a failure before trying again
+EMBEDDING_RETRY_AFTER = 300
+
+# Common abbreviations expanded before caching so that e.g. "pls" and "please"
+# share a cache entry.
+_ABBREVIATIONS = {
+    "pls": "please",
+    "plz": "please",
+    "u": "you",
+    "ur": "your",
+    "info": "information",
+    "acct": "account",
+}
+
+
+def normalize(request: str) -> str:
+    """
+    Normalizes a request into a cache key: lowercased, whitespace collapsed,
+    and common abbreviations expanded.
+    """
+    return " ".join(_ABBREVIATIONS.get(word, word) for word in request.lower().split())
+
+
+@functools.cache
+def _genai_client():
+    from google import genai
+
+    return genai.Client()
+
+
+def pick_by_score(scores: Dict[str, float]) -> Optional[str]:
+    """
+    Returns the specialist with the highest similarity if it reaches
+    EMBEDDING_ROUTE_THRESHOLD and leads the runner-up by at least
+    EMBEDDING_ROUTE_MARGIN, otherwise None.
+    """
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked:
+        return None
+    best, best_score = ranked[0]
+    runner_up_score = ranked[1][1] if len(ranked) > 1 else -1.0
+    if best_score < EMBEDDING_ROUTE_THRESHOLD or best_score - runner_up_score < EMBEDDING_ROUTE_MARGIN:
+        return None
+    return best
+
+
+def _check_private_dir(path: str) -> None:
+    """
+    Raises PermissionError unless path is owned by the current user and not
+    accessible to anyone else. Skipped where POSIX ownership does not apply.
+    """
+    if not hasattr(os, "getuid"):
+        return
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(
+            f"{path} must be owned by the current user with mode 0700 (chmod 700 {path})"
+        )
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+
+async def _embed(texts: List[str]) -> List[List[float]]:
+    response = await _genai_client().aio.models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+    return [_unit(embedding.values) for embedding in response.embeddings]
+
+
+def _make_user_content(text: str) -> types.Content:
+    """
+    Builds the user message for a request.
+    """
+    from google.genai import types
+
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+class Coordinator:
+    """
+    Routes requests for one chapter's coordinator agent.
+
+    Args:
+        name: Identifies the chapter; names its route cache database.
+        label: Prefixes the progress output.
+        intent_patterns: Keyword regex per specialist for the fast path.
+        intent_handlers: Handler to call directly per specialist.
+        intent_examples: Example requests per specialist for embedding routing.
+        cache_version: Identifies what produced the cached results, e.g. the
+            model name and coordinator instruction. Changing it makes
+            earlier cache entries unreachable.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        label: str,
+        intent_patterns: Dict[str, str],
+        intent_handlers: Dict[str, Callable[[str], str]],
+        intent_examples: Dict[str, List[str]],
+        cache_version: str = "",
+    ):
+        self.name = name
+        self.label = label
+        self.intent_patterns = intent_patterns
+        self.intent_handlers = intent_handlers
+        self.intent_examples = intent_examples
+        self.cache_version = cache_version
+        # All intents compiled into one alternation with a named group per
+        # specialist, so one finditer call reports every matching specialist
+        # instead of one search call per pattern. re still tries each
+        # alternative at each position, so this saves call overhead, not scan work.
+        self._intent_re = re.compile(
+            "|".join(f"(?P<{name}>{pattern})" for name, pattern in intent_patterns.items()),
+            re.IGNORECASE,
+        )
+        # SQLite connections can only be used on the thread that opened them, so
+        # each thread keeps its own.
+        self._cache_local = threading.local()
+        # Set once the cache directory turns out to be unsafe, so the warning
+        # is logged once instead of on every request
+        self._cache_disabled = False
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        # Serializes the first centroid build so concurrent requests share it.
+        # An asyncio.Lock belongs to the loop it is first used on, so each
+        # event loop gets its own, created on first use.
+        self._centroids_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # time.monotonic() until which embedding routing is skipped after a failure
+        self._embedding_disabled_until = 0.0
+
+    # --- Routing Cache ---
+    def _route_cache(self) -> sqlite3.Connection:
+        """
+        Opens (and creates on first use) this chapter's route cache database for
+        the current thread.
+        """
+        conn = getattr(self._cache_local, "conn", None)
+        if conn is None:
+            os.makedirs(ROUTE_CACHE_DIR, mode=0o700, exist_ok=True)
+            _check_private_dir(ROUTE_CACHE_DIR)
+            conn = sqlite3.connect(os.path.join(ROUTE_CACHE_DIR, f'{self.name}.sqlite3'))
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS route_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._cache_local.conn = conn
+        return conn
+
+    def _cache_key(self, normalized: str) -> str:
+        return hashlib.sha256(f"{self.cache_version}\0{normalized}".encode()).hexdigest()
+
+    def cache_get(self, normalized: str) -> Optional[str]:
+        """
+        Returns the cached final result for a normalized request, if still valid.
+        The cache is best-effort: any error is logged and treated as a miss.
+        """
+        if self._cache_disabled:
+            return None
+        try:
+            row = self._route_cache().execute(
+                "SELECT value FROM route_cache WHERE key = ? AND expires_at > ?",
+                (self._cache_key(normalized), time.time()),
+            ).fetchone()
+        except PermissionError as e:
+            self._disable_cache(e)
+            return None
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Route cache read failed: %s", e)
+            return None
+        return row[0] if row else None
+
+    def cache_set(self, normalized: str, result: str) -> None:
+        """
+        Stores a final result for a normalized request. Errors are logged and
+        the write is skipped.
+        """
+        if self._cache_disabled:
+            return
+        try:
+            conn = self._route_cache()
+            conn.execute(
+                "INSERT OR REPLACE INTO route_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (self._cache_key(normalized), result, time.time() + ROUTE_CACHE_TTL),
+            )
+            conn.commit()
+        except PermissionError as e:
+            self._disable_cache(e)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Route cache write failed: %s", e)
+
+    def _disable_cache(self, error: OSError) -> None:
+        self._cache_disabled = True
+        logger.warning("Route cache disabled: %s", error)
+
+    # --- Keyword Fast Path ---
+    def match_intents(self, request: str) -> Set[str]:
+        """
+        Returns the names of all specialists whose intent pattern matches the
+        request.
+        """
+        return {match.lastgroup for match in self._intent_re.finditer(request)}
+
+    def classify(self, request: str) -> Optional[str]:
+        """
+        Returns the specialist name if exactly one intent pattern matches the
+        request, otherwise None.
+        """
+        matches = self.match_intents(request)
+        return matches.pop() if len(matches) == 1 else None
+
+    # --- Embedding Routing ---
+    async def _intent_centroids(self) -> Dict[str, List[float]]:
+        """
+        Embeds the example requests on first use and returns the unit-length
+        centroid for each specialist.
+        """
+        loop = asyncio.get_running_loop()
+        lock = self._centroids_locks.get(loop)
+        if lock is None:
+            lock = self._centroids_locks[loop] = asyncio.Lock()
+        async with lock:
+            if self._centroids is None:
+                # Embed every example in a single call, then split per specialist
+                examples = self.intent_examples
+                vectors = await _embed([text for texts in examples.values() for text in texts])
+                centroids = {}
+                start = 0
+                for name, texts in examples.items():
+                    group = vectors[start:start + len(texts)]
+                    start += len(texts)
+                    centroids[name] = _unit([sum(column) / len(group) for column in zip(*group)])
+                self._centroids = centroids
+        return self._centroids
+
+    async def embedding_scores(self, request: str) -> Dict[str, float]:
+        """
+        Returns the cosine similarity of the request to each specialist's
+        centroid.
+        """
+        centroids = await self._intent_centroids()
+        (query,) = await _embed([request])
+        return {
+            name: sum(a * b for a, b in zip(query, centroid))
+            for name, centroid in centroids.items()
+        }
+
+    async def embedding_route(self, request: str) -> Optional[str]:
+        """
+        Returns the specialist picked by pick_by_score() for the request, or
+        None if there is no clear pick, embedding routing is disabled, or
+        embedding fails. After a failure, embedding routing is skipped for
+        EMBEDDING_RETRY_AFTER seconds.
+        """
+        if not EMBEDDING_ROUTING or time.monotonic() < self._embedding_disabled_until:
+            return None
+        try:
+            scores = await self.embedding_scores(request)
+        except Exception as e:
+            self._embedding_disabled_until = time.monotonic() + EMBEDDING_RETRY_AFTER
+            logger.warning(
+                "Embedding routing unavailable for %ss, falling back to the LLM: %s",
+                EMBEDDING_RETRY_AFTER, e,
+            )
+            return None
+        return pick_by_score(scores)
+
+    # --- Execute Logic ---
+    async def run(
+        self,
+        runner: InMemoryRunner,
+        request: str,
+        *,
+        cache: bool = True,
+        fast_path: bool = FAST_PATH,
+    ) -> str:
+        """
+        Runs the runner's root agent with a given request and delegates.
+        Pass cache=False to bypass the route cache, and fast_path=False to
+        always run the agents instead of routing by keyword or embedding.
+        """
+        label = self.label
+        logger.info("Running %s for request: '%s'", label, request)
+        final_result = ""
+
+        # Strip and normalize once up front; the cache and keyword routing both
+        # work on the normalized form, while the handlers and the model still
+        # see the request as written.
+        request = request.strip()
+        if not request:
+            return final_result
+        key = normalize(request)
+        # SQLite I/O runs in a worker thread so it never blocks the event loop
+        cached = await asyncio.to_thread(self.cache_get, key) if cache else None
+        if cached is not None:
+            logger.info("Cache hit for request: '%s'", request)
+            return cached
+
+        specialist = None
+        routed_by_embedding = False
+        if fast_path:
+            matches = self.match_intents(key)
+            if len(matches) == 1:
+                specialist = matches.pop()
+            elif not matches:
+                # Only requests no pattern recognizes go to embedding routing.
+                # Several matches mean the request mixes intents, which is
+                # exactly what the LLM should sort out.
+                specialist = await self.embedding_route(request)
+                routed_by_embedding = specialist is not None
+        if specialist is not None:
+            final_result = self.intent_handlers[specialist](request)
+            logger.info("Routed to %s without the LLM: %s", specialist, final_result)
+            # Cache embedding-routed results so repeats skip the embedding call
+            if routed_by_embedding and cache:
+                await asyncio.to_thread(self.cache_set, key, final_result)
+            return final_result
+
+        try:
+            user_id = USER_ID
+            session_id = uuid.uuid4().hex
+            await runner.session_service.create_session(
+                app_name=runner.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+
+            async for event in runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=_make_user_content(request)
+            ):
+                if event.is_final_response() and event.content:
+                    # Try to get text directly from event content
+                    # to avoid iterating parts
+                    content = event.content
+                    parts = content.parts
+                    if hasattr(content, 'text') and content.text:
+                        final_result = content.text
+                    elif parts:
+                        # Fallback to iterating parts and extract text (might trigger warning)
+                        final_result = " ".join(part.text for part in parts if part.text)
+                    # Don't cache an empty response; let the next request retry
+                    if cache and final_result:
+                        await asyncio.to_thread(self.cache_set, key, final_result)
+                    # Assume the loop should break after the final response
+                    break
+            logger.info("%s Final Response: %s", label, final_result)
+            return final_result
+        except Exception as e:
+            logger.error("An error occurred while processing the request: %s", e)
+            return f"An error occurred while processing your request: {e}"
+
+    async def run_batch(
+        self,
+        runner: InMemoryRunner,
+        requests: List[str],
+        *,
+        cache: bool = True,
+        fast_path: bool = FAST_PATH,
+    ) -> List[str]:
+        """
+        Runs many independent requests and returns their results in order.
+        cache and fast_path are passed on to run().
+
+        Requests that normalize to the same text are run only once. The rest run
+        concurrently, each in its own fresh session, with at most MAX_PARALLEL
+        in flight at once to stay within model rate limits.
+        """
+        unique = {}
+        for request in requests:
+            unique.setdefault(normalize(request), request)
+
+        sem = asyncio.Semaphore(MAX_PARALLEL)
+
+        async def _run_bounded(request: str) -> str:
+            async with sem:
+                # Contain failures per request so one error doesn't abort the gather
+                try:
+                    return await self.run(runner, request, cache=cache, fast_path=fast_path)
+                except Exception as e:
+                    return f"An error occurred while processing your request: {e}"
+
+        results = await asyncio.gather(*[_run_bounded(request) for request in unique.values()])
+        by_key = dict(zip(unique, results))
+        return [by_key[normalize(request)] for request in requests]
@@ -0,0 +1,91 @@
+"""Environment setup shared by the chapter agents."""
+import logging
+import os
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def first_env(*keys: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the value of the first environment variable in keys that is set.
+    """
+    env = os.environ
+    return next((env[key] for key in keys if key in env), default)
+
+
+def env_int(key: str, default: int, minimum: int = 1) -> int:
+    """
+    Returns an integer environment variable, clamped to at least minimum.
+    Falls back to default when the variable is unset or not an integer.
+    """
+    try:
+        value = int(os.environ.get(key, default))
+    except ValueError:
+        logger.warning("Ignoring invalid %s=%r, using %d", key, os.environ[key], default)
+        value = default
+    return max(minimum, value)
+
+
+def load_environment(agent_dir: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Loads .env and configures service account and Vertex AI credentials for
+    the agent package in agent_dir. Returns the Vertex AI project and
+    location in use.
+    """
+    # --- Load .env if present ---
+    try:
+        from dotenv import load_dotenv
+        # Try loading from the agent directory first (e.g. chapter1/.env)
+        dotenv_path = os.path.join(agent_dir, '.env')
+        if os.path.exists(dotenv_path):
+            load_dotenv(dotenv_path)
+        else:
+            # Fallback to parent directory
+            dotenv_path = os.path.join(agent_dir, '..', '.env')
+            if os.path.exists(dotenv_path):
+                load_dotenv(dotenv_path)
+    except ImportError:
+        pass  # dotenv is optional
+
+    # --- Configure Service Account and Vertex AI credentials ---
+    # Service account authentication is configured via GOOGLE_APPLICATION_CREDENTIALS
+    # This environment variable should point to your service account JSON key file.
+    #
+    # Configuration options (in order of precedence):
+    # 1. GOOGLE_APPLICATION_CREDENTIALS environment variable (already set)
+    # 2. SERVICE_ACCOUNT_KEY_PATH from .env file
+    # 3. Default path: cred/genai-vertex-data-engineering.json (relative to project root)
+    #
+    # To use a service account:
+    # - Set SERVICE_ACCOUNT_KEY_PATH in your .env file, OR
+    # - Set GOOGLE_APPLICATION_CREDENTIALS environment variable directly
+
+    # Get service account key path from environment or use default
+    service_account_path = (
+        os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or
+        os.environ.get('SERVICE_ACCOUNT_KEY_PATH') or
+        os.path.join(agent_dir, '..', '..', 'cred', 'genai-vertex-data-engineering.json')
+    )
+
+    # Set GOOGLE_APPLICATION_CREDENTIALS if service account file exists
+    service_account_exists = os.path.exists(service_account_path)
+    if service_account_exists and not os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
+        service_account_abs = os.path.abspath(service_account_path)
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = service_account_abs
+        print(f"Using service account: {service_account_abs}")
+    elif not service_account_exists:
+        print(f"Warning: Service account file not found at {service_account_path}")
+        print("Set GOOGLE_APPLICATION_CREDENTIALS or SERVICE_ACCOUNT_KEY_PATH to use service account authentication.")
+
+    # Get Vertex AI configuration from environment variables
+    vertex_project = first_env('GOOGLE_CLOUD_PROJECT', 'GCP_PROJECT', 'PROJECT')
+    vertex_location = first_env('GOOGLE_CLOUD_LOCATION', 'GCP_LOCATION', 'LOCATION', default='us-central1')
+
+    # Set environment variables as fallback for underlying Client initialization
+    if vertex_project and not os.environ.get('GOOGLE_CLOUD_PROJECT'):
+        os.environ['GOOGLE_CLOUD_PROJECT'] = vertex_project
+    if vertex_location and not os.environ.get('GOOGLE_CLOUD_LOCATION'):
+        os.environ['GOOGLE_CLOUD_LOCATION'] = vertex_location
+
+    return vertex_project, vertex_location
@@ -0,0 +1,114 @@
+"""
+Checks the keyword fast path against known requests, so that an edit to the
+intent patterns that misroutes one fails here instead of silently skipping
+the LLM. None means the request is left to the LLM.
+
+The embedding routing tests at the end call the embedding API. They are
+skipped unless ADK_LIVE_TESTS=1; run them with `pytest -s` to print the
+similarity scores when tuning EMBEDDING_ROUTE_THRESHOLD and
+EMBEDDING_ROUTE_MARGIN.
+"""
+import asyncio
+import os
+
+import pytest
+
+from chapter1.agent import coordinator as chapter1_coordinator
+from chapter2.agent import coordinator as chapter2_coordinator
+from common.coordinator import normalize, pick_by_score
+
+CHAPTER1_CASES = [
+    ("Book me a hotel in Paris.", "Booker"),
+    ("Please reserve a room for two nights.", "Booker"),
+    ("Can you book two flights to Tokyo?", "Booker"),
+    ("What is the best book on Rome?", None),
+    ("How many flights leave JFK daily?", None),
+    ("Which hotel chain is the largest?", None),
+    ("Tell me a random fact.", None),
+    ("Is it cheaper to book flights on Tuesday?", None),
+    ("Don't book a hotel, just tell me about Paris hotels", None),
+]
+
+CHAPTER2_CASES = [
+    ("I can't log into my account. Can you help?", "TechnicalSupport"),
+    ("The app crashes on startup.", "TechnicalSupport"),
+    ("What are the payment options available?", "Billing"),
+    ("My payment failed. What should I do?", "Billing"),
+    ("What features does the premium plan include?", "ProductInfo"),
+    ("I plan to cancel my order", None),
+    ("How do I charge my phone?", None),
+    ("I need a refund because the app keeps crashing", None),
+]
+
+
+@pytest.mark.parametrize("request_text, expected", CHAPTER1_CASES)
+def test_chapter1_classify(request_text, expected):
+    assert chapter1_coordinator.classify(normalize(request_text)) == expected
+
+
+@pytest.mark.parametrize("request_text, expected", CHAPTER2_CASES)
+def test_chapter2_classify(request_text, expected):
+    assert chapter2_coordinator.classify(normalize(request_text)) == expected
+
+
+def test_ambiguous_request_skips_embedding_routing(monkeypatch):
+    # Two intents match, so the request must reach the agents even if
+    # embedding routing would pick a specialist.
+    async def embedding_route(request):
+        raise AssertionError("embedding routing used for an ambiguous request")
+
+    class AgentsReached(Exception):
+        pass
+
+    class Runner:
+        app_name = "test"
+
+        class session_service:
+            @staticmethod
+            async def create_session(**kwargs):
+                raise AgentsReached
+
+    request = "I need a refund because the app keeps crashing"
+    assert chapter2_coordinator.match_intents(normalize(request)) == {"Billing", "TechnicalSupport"}
+    monkeypatch.setattr(chapter2_coordinator, "embedding_route", embedding_route)
+    result = asyncio.run(chapter2_coordinator.run(Runner(), request, cache=False))
+    assert result.startswith("An error occurred")
+
+
+@pytest.mark.parametrize(
+    "scores, expected",
+    [
+        ({"Billing": 0.82, "TechnicalSupport": 0.70, "ProductInfo": 0.61}, "Billing"),
+        # Below the threshold
+        ({"Billing": 0.70, "TechnicalSupport": 0.55, "ProductInfo": 0.50}, None),
+        # Above the threshold but too close to the runner-up
+        ({"Billing": 0.80, "TechnicalSupport": 0.78, "ProductInfo": 0.50}, None),
+        ({}, None),
+    ],
+)
+def test_pick_by_score(scores, expected):
+    assert pick_by_score(scores) == expected
+
+
+live = pytest.mark.skipif(
+    os.environ.get("ADK_LIVE_TESTS") != "1", reason="set ADK_LIVE_TESTS=1 to call the embedding API"
+)
+
+# Paraphrases that none of the keyword patterns match, none of which is one
+# of the chapter's _INTENT_EXAMPLES
+EMBEDDING_CASES = [
+    (chapter1_coordinator, "Get me a seat on a plane to Rome on Monday.", "Booker"),
+    (chapter1_coordinator, "Why is the sky blue?", "Info"),
+    (chapter2_coordinator, "My screen goes blank whenever I open the app.", "TechnicalSupport"),
+    (chapter2_coordinator, "Why was I charged twice?", "Billing"),
+    (chapter2_coordinator, "Does the pro version work offline?", "ProductInfo"),
+    (chapter2_coordinator, "Hello there.", None),
+]
+
+
+@live
+@pytest.mark.parametrize("coordinator, request_text, expected", EMBEDDING_CASES)
+def test_embedding_route_scores(coordinator, request_text, expected):
+    scores = asyncio.run(coordinator.embedding_scores(request_text))
+    print(request_text, {name: round(score, 3) for name, score in scores.items()})
+    assert pick_by_score(scores) == expected